@@ -35,23 +35,45 @@ python3 subsflow.py validate-tsv French_translation.tsv --expect-columns 3
 
 from __future__ import annotations
 import argparse
+import array
+import bisect
+import contextlib
+import dataclasses
+import functools
 import re
 import sys
-from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from collections import deque
+from typing import List, Dict, Iterable, Tuple, Optional
 
 
 # ----------------------------
 # Shared helpers and utilities
 # ----------------------------
 
+# Precompiled patterns (hot paths call these once per caption/token)
+_SANI_RE = re.compile(r"^[^\w']+|[^\w']+$")
+_ID_RE = re.compile(r"\d+")
+
+# TSV report: field counts below this go in a flat histogram list
+_HIST_SLOTS = 16
+
+# I/O: entries per write() call, and the underlying file buffer sizes
+_WRITE_CHUNK = 4096
+_WRITE_BUFFER = 1 << 20
+_READ_BUFFER = 1 << 20
+
+
 def normalize_space(s: str) -> str:
-    return re.sub(r"\s+", " ", s).strip()
+    # Collapse whitespace runs to single spaces; keep tokens like ">>".
+    # str.split() uses the same Unicode whitespace set as the regex \s.
+    return " ".join(s.split())
 
 
 def _escape_newlines_for_tsv(s: str) -> str:
     # Replace actual newlines with explicit \n so TSV stays one-line per caption
-    return s.replace("\r\n", "\n").replace("\r", "\n").replace("\n", r"\n")
+    if "\r" in s:
+        s = s.replace("\r\n", "\n").replace("\r", "\n")
+    return s.replace("\n", r"\n")
 
 
 def _unescape_newlines_from_tsv(s: str) -> str:
@@ -59,6 +81,29 @@ def _unescape_newlines_from_tsv(s: str) -> str:
     return s.replace(r"\n", "\n")
 
 
+def _open_text_output(path: str):
+    """
+    Open a UTF-8 text output with a wide buffer. newline="\n" keeps line
+    endings as LF on every platform (no CRLF translation on Windows).
+    """
+    return open(path, "w", encoding="utf-8", buffering=_WRITE_BUFFER, newline="\n")
+
+
+def _write_chunked(out, chunks: Iterable[str]) -> None:
+    """
+    Write an iterable of strings, joining up to _WRITE_CHUNK of them per
+    write() call to amortize per-call overhead while keeping memory bounded.
+    """
+    buf: List[str] = []
+    for chunk in chunks:
+        buf.append(chunk)
+        if len(buf) >= _WRITE_CHUNK:
+            out.write("".join(buf))
+            buf.clear()
+    if buf:
+        out.write("".join(buf))
+
+
 def prompt_yes_no(message: str, default: bool = False) -> bool:
     """
     Ask a yes/no question on TTY. If not a TTY (piped/cron), return default.
@@ -79,32 +124,47 @@ def prompt_yes_no(message: str, default: bool = False) -> bool:
 # SRT parsing/writing
 # ----------------------------
 
-def parse_srt(path: str) -> List[Dict]:
-    """
-    Parse an .srt file into a list of entries:
-      {
-        'seq': int,               # 1-based index in file
-        'id': Optional[int],      # numeric caption ID if present
-        'start': str,
-        'end': str,
-        'text_lines': List[str],  # original text lines
-        'text': str               # single-line normalized text
-      }
-    """
-    raw = Path(path).read_text(encoding="utf-8", errors="replace").strip()
-    if not raw:
-        return []
-
-    blocks = re.split(r"(?:\r?\n){2,}", raw)
-
-    entries: List[Dict] = []
-    seq = 0
-    for b in blocks:
-        lines_raw = b.splitlines()
-        lines = [ln.strip() for ln in lines_raw if ln.strip() != ""]
-        if not lines:
-            continue
-
+def _read_srt_blocks(path: str):
+    """
+    Stream an .srt file and yield one block at a time as a list of stripped,
+    non-empty lines. Blocks are separated by one or more blank lines.
+    """
+    buf: List[str] = []
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if not line:
+                if buf:
+                    yield buf
+                    buf = []
+                continue
+            line = line.strip()
+            if line:
+                buf.append(line)
+    if buf:
+        yield buf
+
+
+@dataclasses.dataclass
+class SrtEntry:
+    # Explicit __slots__ (rather than slots=True, which needs Python 3.10)
+    # drops the per-instance __dict__; fields therefore take no defaults.
+    __slots__ = ("seq", "id", "start", "end", "text_lines", "text")
+
+    seq: int               # 1-based index in file
+    id: Optional[int]      # numeric caption ID if present
+    start: str
+    end: str
+    text_lines: List[str]  # original text lines
+    text: str              # single-line normalized text
+
+
+def _iter_blocks(path: str):
+    """
+    Yield (lines, timing_idx, cap_id, start, end) for every valid caption
+    block of an .srt file; blocks without a timing line are skipped.
+    """
+    for lines in _read_srt_blocks(path):
         # Find timing line (contains -->)
         timing_idx = None
         for i, line in enumerate(lines[:4]):  # usually within first 2-3 lines
@@ -116,7 +176,7 @@ def parse_srt(path: str) -> List[Dict]:
 
         # Optional numeric ID before timing
         cap_id = None
-        if timing_idx >= 1 and re.fullmatch(r"\d+", lines[0]):
+        if timing_idx >= 1 and _ID_RE.fullmatch(lines[0]):
             try:
                 cap_id = int(lines[0])
             except ValueError:
@@ -130,52 +190,135 @@ def parse_srt(path: str) -> List[Dict]:
         except Exception:
             continue
 
-        text_lines = [ln for ln in lines[timing_idx + 1:]]
-        text = normalize_space(" ".join(text_lines)) if text_lines else ""
+        # Consecutive captions share boundary timestamps (end == next start);
+        # interning keeps one string object per distinct timestamp.
+        yield lines, timing_idx, cap_id, sys.intern(start), sys.intern(end)
+
 
-        seq += 1
-        entries.append({
-            "seq": seq,
-            "id": cap_id,
-            "start": start,
-            "end": end,
-            "text_lines": text_lines,
-            "text": text,
-        })
+def parse_srt(path: str) -> List[SrtEntry]:
+    """
+    Parse an .srt file into a list of SrtEntry (see fields above).
+    """
+    entries: List[SrtEntry] = []
+    for seq, (lines, timing_idx, cap_id, start, end) in enumerate(_iter_blocks(path), 1):
+        text_lines = lines[timing_idx + 1:]
+        text = normalize_space(" ".join(text_lines)) if text_lines else ""
+        entries.append(SrtEntry(
+            seq=seq,
+            id=cap_id,
+            start=start,
+            end=end,
+            text_lines=text_lines,
+            text=text,
+        ))
 
     return entries
 
 
-def write_srt(entries: List[Dict], path: str, numbering: str = "renumber") -> None:
+def parse_srt_timestamps_only(path: str) -> List[SrtEntry]:
+    """
+    Like parse_srt, but skip building caption text (text_lines=[] and
+    text=""). For callers such as rejoin that replace the text anyway.
+    """
+    return [
+        SrtEntry(seq=seq, id=cap_id, start=start, end=end, text_lines=[], text="")
+        for seq, (_, _, cap_id, start, end) in enumerate(_iter_blocks(path), 1)
+    ]
+
+
+def write_srt(entries: List[SrtEntry], path: str, numbering: str = "renumber") -> None:
     """
     Write entries back to .srt format.
     numbering:
       - "original": use original IDs if they exist, else fall back to sequential
       - "renumber": write 1..N (recommended for cleanliness)
     """
-    with open(path, "w", encoding="utf-8") as out:
+    def render():
         for i, e in enumerate(entries, 1):
             if numbering == "renumber":
                 idx = i
             else:
-                idx = e["id"] if e.get("id") is not None else i
-            out.write(f"{idx}\n")
-            out.write(f"{e['start']} --> {e['end']}\n")
-            out.write(f"{e['text']}\n\n")
+                idx = e.id if e.id is not None else i
+            yield f"{idx}\n{e.start} --> {e.end}\n{e.text}\n\n"
+
+    with _open_text_output(path) as out:
+        _write_chunked(out, render())
 
 
 # ------------------------------------
 # CLEAN: YouTube auto-captions unroller
 # ------------------------------------
 
+@functools.lru_cache(maxsize=65536)
 def sanitize_word(tok: str) -> str:
-    # Strip leading/trailing punctuation; keep alphanumerics and apostrophes
-    return re.sub(r"^[^\w']+|[^\w']+$", "", tok).lower()
+    # Strip leading/trailing punctuation; keep alphanumerics and apostrophes.
+    # Interned so variants like "Hello," and "hello" share one object and
+    # token comparisons in _kmp_overlap short-circuit on identity.
+    return sys.intern(_SANI_RE.sub("", tok).lower())
+
+
+# Former duplicate of normalize_space, kept as an alias for compatibility
+normalize_text = normalize_space
+
+
+def _kmp_overlap(curr: List[str], prev: List[str]) -> int:
+    """
+    Length of the longest prefix of curr that is also a suffix of prev.
+    Builds the KMP failure table of curr, then runs the matcher over the
+    tail of prev, so it runs in O(len(curr)) instead of comparing every
+    candidate length.
+    """
+    m = len(curr)
+    if not m or not prev:
+        return 0
+    fail = [0] * m
+    j = 0
+    for i in range(1, m):
+        while j and curr[i] != curr[j]:
+            j = fail[j - 1]
+        if curr[i] == curr[j]:
+            j += 1
+        fail[i] = j
+
+    # An overlap is at most m tokens long, so only the last m tokens of prev
+    # can take part in it.
+    j = 0
+    for tok in prev[-m:]:
+        while j and tok != curr[j]:
+            j = fail[j - 1]
+        if tok == curr[j]:
+            j += 1  # j == m is only reachable on the last token of the window
+    return j
+
+
+def _sanitize_tokens(raw_tokens: List[str]) -> Tuple[List[str], List[int]]:
+    """
+    Sanitize raw tokens, dropping those that become empty.
+    Returns (sanitized tokens, raw index of each sanitized token).
+    """
+    san: List[str] = []
+    raw_idx: List[int] = []
+    for i, t in enumerate(raw_tokens):
+        sw = sanitize_word(t)
+        if sw:
+            san.append(sw)
+            raw_idx.append(i)
+    return san, raw_idx
 
 
-def normalize_text(s: str) -> str:
-    # Collapse whitespace; keep tokens like ">>"
-    return re.sub(r"\s+", " ", s).strip()
+def _overlap_drop(prev_san: List[str], curr_san: List[str], raw_idx_for_curr_san: List[int]) -> int:
+    """
+    Number of raw tokens to drop from the current caption, given the
+    sanitized tokens of the previous window and of the current caption.
+    """
+    if not prev_san or not curr_san:
+        return 0
+
+    k = _kmp_overlap(curr_san, prev_san)
+    if k:
+        raw_drop_until = raw_idx_for_curr_san[k - 1]  # inclusive raw index
+        return raw_drop_until + 1
+    return 0
 
 
 def longest_suffix_prefix_overlap(prev_text: str, curr_text: str) -> int:
@@ -191,24 +334,9 @@ def longest_suffix_prefix_overlap(prev_text: str, curr_text: str) -> int:
     prev_raw = prev_norm.split()
     curr_raw = curr_norm.split()
 
-    prev_san = [sanitize_word(t) for t in prev_raw if sanitize_word(t)]
-    curr_san = []
-    raw_idx_for_curr_san = []
-    for i, t in enumerate(curr_raw):
-        sw = sanitize_word(t)
-        if sw:
-            curr_san.append(sw)
-            raw_idx_for_curr_san.append(i)
-
-    if not prev_san or not curr_san:
-        return 0
-
-    max_k = min(len(prev_san), len(curr_san))
-    for k in range(max_k, 0, -1):
-        if prev_san[-k:] == curr_san[:k]:
-            raw_drop_until = raw_idx_for_curr_san[k - 1]  # inclusive raw index
-            return raw_drop_until + 1
-    return 0
+    prev_san = [sw for sw in map(sanitize_word, prev_raw) if sw]
+    curr_san, raw_idx_for_curr_san = _sanitize_tokens(curr_raw)
+    return _overlap_drop(prev_san, curr_san, raw_idx_for_curr_san)
 
 
 def cmd_clean(args) -> None:
@@ -216,34 +344,62 @@ def cmd_clean(args) -> None:
     if not entries:
         raise SystemExit("No valid SRT entries found in input.")
 
-    cleaned: List[Dict] = []
-    prev_window_text = ""
+    cleaned: List[SrtEntry] = []
+    # Sanitized tokens of the previous caption window, kept across iterations
+    # so each caption is tokenized and sanitized only once.
+    prev_san: List[str] = []
+    # Opt-in (--dedupe-window N): drop captions whose full text equals one of
+    # the last N kept captions. This also drops genuine repeated lines
+    # ("Yes.", "[Music]"), so it is off by default.
+    window = args.dedupe_window
+    recent: deque = deque()  # kept texts in the window, oldest first
+    # kept text -> [occurrences in window, sanitized tokens of that text]
+    recent_info: Dict[str, list] = {}
 
     for e in entries:
-        curr_text = normalize_text(e["text"])
+        curr_text = normalize_text(e.text)
         if not curr_text:
-            prev_window_text = curr_text
+            prev_san = []
             continue
 
-        drop = longest_suffix_prefix_overlap(prev_window_text, curr_text)
+        if window:
+            info = recent_info.get(curr_text)
+            if info is not None:
+                # Same text as a recently kept caption; it still becomes the
+                # previous window for the next caption.
+                prev_san = info[1]
+                continue
+
+        raw_tokens = curr_text.split()
+        curr_san, raw_idx_for_curr_san = _sanitize_tokens(raw_tokens)
+        drop = _overlap_drop(prev_san, curr_san, raw_idx_for_curr_san)
+        prev_san = curr_san
         if drop > 0:
-            raw_tokens = curr_text.split()
             curr_new = " ".join(raw_tokens[drop:]).strip()
         else:
             curr_new = curr_text
 
         if not curr_new:
-            prev_window_text = curr_text
             continue
 
-        if cleaned and normalize_text(cleaned[-1]["text"]) == curr_new:
-            prev_window_text = curr_text
+        # Kept texts are already normalized (built from split tokens)
+        if cleaned and cleaned[-1].text == curr_new:
             continue
 
-        new_e = dict(e)
-        new_e["text"] = curr_new
-        cleaned.append(new_e)
-        prev_window_text = curr_text
+        cleaned.append(dataclasses.replace(e, text=curr_new))
+
+        if window:
+            # Sanitized tokens of curr_new are those at or after raw index drop
+            kept_san = curr_san[bisect.bisect_left(raw_idx_for_curr_san, drop):]
+            info = recent_info.setdefault(curr_new, [0, kept_san])
+            info[0] += 1
+            recent.append(curr_new)
+            if len(recent) > window:
+                old = recent.popleft()
+                old_info = recent_info[old]
+                old_info[0] -= 1
+                if not old_info[0]:
+                    del recent_info[old]
 
     write_srt(cleaned, args.output_srt, numbering=args.numbering)
     print(f"OK: {len(entries)} → {len(cleaned)} captions written to {args.output_srt}")
@@ -254,7 +410,7 @@ def cmd_clean(args) -> None:
 # ------------------------------------------
 
 def write_translation_prep(
-    entries: List[Dict],
+    entries: List[SrtEntry],
     out_path: str,
     fmt: str = "tsv",
     id_source: str = "original",
@@ -270,33 +426,37 @@ def write_translation_prep(
        - 2 columns: "<id>\\t<text>"
        - 3 columns: "<id>\\t<original_text>\\t" (3rd column left empty as skeleton)
     """
-    def caption_id(e: Dict) -> int:
+    def caption_id(e: SrtEntry) -> int:
         if id_source == "seq":
-            return e["seq"]
-        return e["id"] if e.get("id") is not None else e["seq"]
-
-    with open(out_path, "w", encoding="utf-8") as out:
-        if fmt == "tsv":
-            for e in entries:
-                cid = caption_id(e)
-                if join_with == "keep" and e["text_lines"]:
-                    text = "\n".join(e["text_lines"]).strip()
-                else:
-                    text = e["text"]
-                text_tsv = _escape_newlines_for_tsv(text)
-                if tsv_columns == 3:
-                    out.write(f"{cid}\t{text_tsv}\t\n")
-                else:
-                    out.write(f"{cid}\t{text_tsv}\n")
-        else:
-            # blocks format (no timestamps): ID line, then text, blank line between captions
-            for e in entries:
-                cid = caption_id(e)
-                if join_with == "keep" and e["text_lines"]:
-                    text_block = "\n".join(e["text_lines"]).strip()
-                else:
-                    text_block = e["text"]
-                out.write(f"{cid}\n{text_block}\n\n")
+            return e.seq
+        return e.id if e.id is not None else e.seq
+
+    def render_tsv():
+        for e in entries:
+            cid = caption_id(e)
+            if join_with == "keep" and e.text_lines:
+                # parse_srt yields stripped single lines, so join them with the
+                # escaped separator directly instead of escaping a second pass
+                text_tsv = r"\n".join(e.text_lines)
+            else:
+                text_tsv = _escape_newlines_for_tsv(e.text)
+            if tsv_columns == 3:
+                yield f"{cid}\t{text_tsv}\t\n"
+            else:
+                yield f"{cid}\t{text_tsv}\n"
+
+    def render_blocks():
+        # blocks format (no timestamps): ID line, then text, blank line between captions
+        for e in entries:
+            cid = caption_id(e)
+            if join_with == "keep" and e.text_lines:
+                text_block = "\n".join(e.text_lines).strip()
+            else:
+                text_block = e.text
+            yield f"{cid}\n{text_block}\n\n"
+
+    with _open_text_output(out_path) as out:
+        _write_chunked(out, render_tsv() if fmt == "tsv" else render_blocks())
 
 
 def cmd_prep(args) -> None:
@@ -326,114 +486,197 @@ def cmd_prep(args) -> None:
 class TSVReport:
     def __init__(self):
         self.total_lines = 0
-        self.field_histogram: Dict[int, int] = {}
+        # field_histogram[nf] counts lines with nf fields (nf < _HIST_SLOTS);
+        # rarer, wider lines are counted in field_histogram_big.
+        self.field_histogram: List[int] = [0] * _HIST_SLOTS
+        self.field_histogram_big: Dict[int, int] = {}
         self.bad_id_lines: List[int] = []
-        self.rows: List[List[str]] = []  # raw split by tabs
+        # Rows are stored column-wise (one slot per non-empty line)
+        self.id_col: List[str] = []             # first column, as read
+        self.ids: List[int] = []                # numeric ID, or -1 if not numeric
+        self.nfields = array.array("I")         # number of tab-separated fields
+        self.middle_cols_joined: List[str] = []  # columns 2..N-1 rejoined by tabs
+        self.last_col: List[str] = []           # last column (== first if single field)
 
     def record_line(self, nf: int):
-        self.field_histogram[nf] = self.field_histogram.get(nf, 0) + 1
+        if nf < _HIST_SLOTS:
+            self.field_histogram[nf] += 1
+        else:
+            self.field_histogram_big[nf] = self.field_histogram_big.get(nf, 0) + 1
+
+    def histogram_items(self) -> List[Tuple[int, int]]:
+        """(fields, count) pairs with a non-zero count, sorted by fields."""
+        items = [(nf, v) for nf, v in enumerate(self.field_histogram) if v]
+        items.extend(sorted(self.field_histogram_big.items()))
+        return items
+
+    @classmethod
+    def from_rows(cls, rows: List[List[str]]) -> "TSVReport":
+        """Build a report's row columns from already tab-split rows."""
+        rep = cls()
+        for parts in rows:
+            rep.add_row(parts)
+        return rep
+
+    def add_row(self, parts: List[str]) -> None:
+        first = parts[0] if parts else ""  # empty rows have no ID
+        self.id_col.append(first)
+        id_str = first.strip()
+        self.ids.append(int(id_str) if _ID_RE.fullmatch(id_str) else -1)
+        self.nfields.append(len(parts))
+        self.middle_cols_joined.append("\t".join(parts[1:-1]))
+        self.last_col.append(parts[-1] if parts else "")
+
+    def row(self, i: int) -> List[str]:
+        """Rebuild the tab-split fields of row i."""
+        nf = self.nfields[i]
+        if nf == 0:
+            return []
+        if nf == 1:
+            return [self.id_col[i]]
+        if nf == 2:
+            return [self.id_col[i], self.last_col[i]]
+        return [self.id_col[i], *self.middle_cols_joined[i].split("\t"), self.last_col[i]]
+
+    @property
+    def rows(self) -> List[List[str]]:
+        """All rows as tab-split field lists (rebuilt from the columns)."""
+        return [self.row(i) for i in range(len(self.ids))]
+
+
+def _open_text_input(path: str):
+    """
+    Open a UTF-8 text input for streaming; "-" means stdin (left open on exit).
+    """
+    if path == "-":
+        sys.stdin.reconfigure(encoding="utf-8", errors="replace")
+        return contextlib.nullcontext(sys.stdin)
+    return open(path, encoding="utf-8", errors="replace", buffering=_READ_BUFFER)
 
 
 def read_tsv_with_report(path: str) -> TSVReport:
     rep = TSVReport()
-    lines = Path(path).read_text(encoding="utf-8", errors="replace").splitlines()
-    for ln_no, line in enumerate(lines, 1):
-        if not line.strip():
-            # preserve empties as no fields if needed; we skip them here
-            continue
-        parts = line.split("\t")
-        rep.rows.append(parts)
-        rep.total_lines += 1
-        rep.record_line(len(parts))
-        if not parts or not parts[0].strip().isdigit():
-            rep.bad_id_lines.append(ln_no)
+    with _open_text_input(path) as f:
+        for ln_no, line in enumerate(f, 1):
+            line = line.rstrip("\n")
+            if not line.strip():
+                # preserve empties as no fields if needed; we skip them here
+                continue
+            parts = line.split("\t")
+            rep.add_row(parts)
+            rep.total_lines += 1
+            # Common case inlined (no method call per line); record_line
+            # remains the general entry point and handles wide rows.
+            nf = len(parts)
+            if nf < _HIST_SLOTS:
+                rep.field_histogram[nf] += 1
+            else:
+                rep.record_line(nf)
+            if rep.ids[-1] < 0:
+                rep.bad_id_lines.append(ln_no)
     return rep
 
 
 def summarize_report(rep: TSVReport) -> str:
     parts = [f"Total non-empty lines: {rep.total_lines}"]
-    if rep.field_histogram:
-        hist = " ".join(f"{v}x{nf}" for nf, v in sorted(rep.field_histogram.items()))
+    hist_items = rep.histogram_items()
+    if hist_items:
+        hist = " ".join(f"{v}x{nf}" for nf, v in hist_items)
         parts.append(f"Columns per line histogram: {hist} (format: count x fields)")
     if rep.bad_id_lines:
         parts.append(f"Lines with non-numeric IDs: {len(rep.bad_id_lines)} (e.g., {rep.bad_id_lines[:10]})")
     return "\n".join(parts)
 
 
-def fix_tsv_rows_merge_middle_columns(rows: List[List[str]]) -> List[List[str]]:
+def fix_tsv_report_merge_middle_columns(rep: TSVReport) -> TSVReport:
     """
     Normalize rows to exactly 3 columns: [id, english, french]
-    - If len(row) == 2: treat as [id, translation]; produce [id, "", translation]
-    - If len(row) >= 3: id, merge middle cols into english, last is translation
+    - If a row has 2 fields: treat as [id, translation]; produce [id, "", translation]
+    - If a row has >= 3 fields: id, merge middle cols into english, last is translation
     - Trim surrounding whitespace in columns
     """
-    fixed: List[List[str]] = []
-    for parts in rows:
-        if len(parts) < 2:
+    fixed = TSVReport()
+    for i, nf in enumerate(rep.nfields):
+        if nf < 2:
             # Skip malformed rows that have fewer than 2 fields
             continue
-        cid = parts[0].strip()
-        if len(parts) == 2:
-            english = ""
-            french = parts[1].strip()
-        else:
-            english = "\t".join(p.strip() for p in parts[1:-1]).strip()
-            french = parts[-1].strip()
-        # Normalize internal whitespace (but do not unescape \n here)
-        english = re.sub(r"\s+", " ", english)
-        french = re.sub(r"\s+", " ", french)
-        fixed.append([cid, english, french])
+        # Normalize internal whitespace (but do not unescape \n here);
+        # this also folds the tabs between merged middle columns.
+        english = normalize_space(rep.middle_cols_joined[i])
+        french = normalize_space(rep.last_col[i])
+        fixed.add_row([rep.id_col[i].strip(), english, french])
+        fixed.total_lines += 1
+        fixed.record_line(3)
     return fixed
 
 
-def parse_translated_pairs_from_rows(rows: List[List[str]], translation_col: str = "auto") -> List[Tuple[int, str]]:
+def _select_last_col(rep: TSVReport):
+    for nf, cid, text in zip(rep.nfields, rep.ids, rep.last_col):
+        if nf >= 2 and cid >= 0:
+            yield cid, text
+
+
+def _select_col2(rep: TSVReport):
+    for nf, cid, middle, last in zip(rep.nfields, rep.ids, rep.middle_cols_joined, rep.last_col):
+        if nf >= 2 and cid >= 0:
+            yield cid, (last if nf == 2 else middle.split("\t", 1)[0])
+
+
+def _select_col3(rep: TSVReport):
+    for nf, cid, middle, last in zip(rep.nfields, rep.ids, rep.middle_cols_joined, rep.last_col):
+        if nf >= 2 and cid >= 0:
+            if nf < 3:
+                raise ValueError("Row lacks 3rd column for translation.")
+            yield cid, (last if nf == 3 else middle.split("\t", 2)[1])
+
+
+_COLUMN_SELECTORS = {
+    "auto": _select_last_col,
+    "last": _select_last_col,
+    "2": _select_col2,
+    "3": _select_col3,
+}
+
+
+def parse_translated_pairs(rep: TSVReport, translation_col: str = "auto") -> List[Tuple[int, str]]:
     """
-    Given split rows (tab-split), extract (id, translated_text).
+    Given a TSV report (tab-split rows), extract (id, translated_text).
     Accepts:
       - 2-col: [id, translation]
       - 3-col: [id, original, translation]
       - N-col (N>3): will read the last column as translation if translation_col is 'auto'/'last'
+    Rows with fewer than 2 fields or a non-numeric ID are skipped.
     """
-    out: List[Tuple[int, str]] = []
-    for parts in rows:
-        if len(parts) < 2:
-            continue
-        id_str = parts[0].strip()
-        if not re.fullmatch(r"\d+", id_str):
-            continue
-        cid = int(id_str)
-
-        col_choice = translation_col.lower()
-        if col_choice in ("auto", "last"):
-            idx = len(parts) - 1
-        elif col_choice == "2":
-            if len(parts) < 2:
-                raise ValueError("Row lacks 2nd column for translation.")
-            idx = 1
-        elif col_choice == "3":
-            if len(parts) < 3:
-                raise ValueError("Row lacks 3rd column for translation.")
-            idx = 2
-        else:
-            raise ValueError("translation_col must be one of: auto, last, 2, 3")
+    # Pick the column-specific row loop once, not per row
+    select = _COLUMN_SELECTORS.get(translation_col.lower())
+    if select is None:
+        raise ValueError("translation_col must be one of: auto, last, 2, 3")
 
-        text = parts[idx]
-        text = _unescape_newlines_from_tsv(text)
-        text_norm = normalize_space(text.replace("\r\n", "\n").replace("\r", "\n").replace("\n", " "))
-        out.append((cid, text_norm))
-    return out
+    # normalize_space folds CR/LF along with other whitespace
+    return [(cid, normalize_space(_unescape_newlines_from_tsv(text))) for cid, text in select(rep)]
+
+
+def fix_tsv_rows_merge_middle_columns(rows: List[List[str]]) -> List[List[str]]:
+    """Row-list form of fix_tsv_report_merge_middle_columns."""
+    return fix_tsv_report_merge_middle_columns(TSVReport.from_rows(rows)).rows
+
+
+def parse_translated_pairs_from_rows(rows: List[List[str]], translation_col: str = "auto") -> List[Tuple[int, str]]:
+    """Row-list form of parse_translated_pairs."""
+    return parse_translated_pairs(TSVReport.from_rows(rows), translation_col)
 
 
 def rejoin_translations(
-    original_entries: List[Dict],
+    original_entries: List[SrtEntry],
     translated_pairs: List[Tuple[int, str]],
     align: str = "id",
     strict: bool = True
-) -> List[Dict]:
+) -> List[SrtEntry]:
     """
     Merge translated text with original timestamps.
     align: 'id' (preferred) or 'seq'
     strict: enforce equal counts and ID sets (when align='id')
+    The original entries are updated in place and returned as the merge.
     """
     if align not in {"id", "seq"}:
         raise ValueError("align must be 'id' or 'seq'")
@@ -445,87 +688,96 @@ def rejoin_translations(
         n = min(n_orig, n_trans)
         merged = []
         for i in range(n):
-            e = dict(original_entries[i])
-            e["text"] = translated_pairs[i][1]
+            # Originals are not reused after merging, so update them in place
+            e = original_entries[i]
+            e.text = translated_pairs[i][1]
             merged.append(e)
         if strict and n != n_orig:
             raise ValueError(f"Translated entries fewer than original (got {n_trans}, need {n_orig}).")
         return merged
 
-    # align by id
-    orig_by_id: Dict[int, Dict] = {}
+    # align by id: one pass over the originals, consuming matched translations
+    trans_by_id: Dict[int, str] = dict(translated_pairs)
+    all_trans: Optional[Dict[int, str]] = None
+    missing_in_trans: List[int] = []
+    merged: List[SrtEntry] = []
     for e in original_entries:
-        if e.get("id") is None:
+        if e.id is None:
             raise ValueError("Original SRT lacks caption numbers for some entries; cannot align by id.")
-        oid = int(e["id"])
-        orig_by_id[oid] = e
-
-    trans_by_id: Dict[int, str] = {cid: txt for cid, txt in translated_pairs}
+        oid = int(e.id)
+        txt = trans_by_id.pop(oid, None)
+        if txt is None:
+            # Either really missing, or an ID repeated in the original SRT
+            # whose translation was already consumed.
+            if all_trans is None:
+                all_trans = dict(translated_pairs)
+            txt = all_trans.get(oid)
+            if txt is None:
+                missing_in_trans.append(oid)
+                txt = ""
+        e.text = txt
+        merged.append(e)
 
     if strict:
-        missing_in_trans = [oid for oid in orig_by_id.keys() if oid not in trans_by_id]
-        extra_in_trans = [tid for tid in trans_by_id.keys() if tid not in orig_by_id]
+        # Whatever was not consumed has no matching original caption
+        extra_in_trans = list(trans_by_id)
         if missing_in_trans or extra_in_trans:
+            missing_in_trans = list(dict.fromkeys(missing_in_trans))
             msg = []
             if missing_in_trans:
                 msg.append(f"Missing translated IDs (first 10): {missing_in_trans[:10]}")
             if extra_in_trans:
                 msg.append(f"Unexpected translated IDs (first 10): {extra_in_trans[:10]}")
             raise ValueError("ID mismatch in strict id mode. " + " ".join(msg))
-        if len(trans_by_id) != len(orig_by_id):
-            raise ValueError(f"Count mismatch (orig={len(orig_by_id)}, translated={len(trans_by_id)}) in strict id mode.")
-
-    merged: List[Dict] = []
-    for e in original_entries:
-        oid = int(e["id"]) if e.get("id") is not None else None
-        if oid is not None and oid in trans_by_id:
-            txt = trans_by_id[oid]
-        else:
-            if strict:
-                raise ValueError(f"Missing translation for caption id {oid}")
-            txt = ""
-        new_e = dict(e)
-        new_e["text"] = txt
-        merged.append(new_e)
     return merged
 
 
-def validate_tsv_against_srt(tsv_rows: List[List[str]], srt_entries: List[Dict], align: str = "id") -> Tuple[bool, str]:
+def validate_tsv_report_against_srt(rep: TSVReport, srt_entries: List[SrtEntry], align: str = "id") -> Tuple[bool, str]:
     """
     Basic integrity checks: numeric IDs, counts, and ID set match (if align=id).
     Returns (ok, message).
     """
     # Filter out lines with non-numeric IDs
-    id_rows = [(int(r[0]), r) for r in tsv_rows if r and r[0].strip().isdigit()]
-    if len(id_rows) != len(tsv_rows):
-        return False, f"{len(tsv_rows) - len(id_rows)} line(s) have non-numeric IDs."
+    tsv_ids = [cid for cid in rep.ids if cid >= 0]
+    if len(tsv_ids) != len(rep.ids):
+        return False, f"{len(rep.ids) - len(tsv_ids)} line(s) have non-numeric IDs."
 
     if align == "seq":
-        if len(id_rows) != len(srt_entries):
-            return False, f"Count mismatch (TSV={len(id_rows)}, SRT={len(srt_entries)})."
+        if len(tsv_ids) != len(srt_entries):
+            return False, f"Count mismatch (TSV={len(tsv_ids)}, SRT={len(srt_entries)})."
         return True, "TSV looks consistent for seq alignment."
 
     # align by id
-    srt_ids = [int(e["id"]) for e in srt_entries if e.get("id") is not None]
+    srt_ids = [int(e.id) for e in srt_entries if e.id is not None]
     if len(srt_ids) != len(srt_entries):
         return False, "Original SRT missing numeric IDs; cannot align by id."
 
-    tsv_ids = [cid for cid, _ in id_rows]
     if len(tsv_ids) != len(srt_ids):
         return False, f"Count mismatch (TSV={len(tsv_ids)}, SRT={len(srt_ids)})."
 
-    if set(tsv_ids) != set(srt_ids):
+    # Fast path: the TSV usually lists the same IDs in the same order
+    if tsv_ids == srt_ids:
+        return True, "TSV IDs match SRT IDs."
+
+    tsv_set = set(tsv_ids)
+    srt_set = set(srt_ids)
+    if tsv_set != srt_set:
         # Identify a small diff sample
-        missing = list(sorted(set(srt_ids) - set(tsv_ids)))[:10]
-        extra = list(sorted(set(tsv_ids) - set(srt_ids)))[:10]
+        missing = sorted(srt_set - tsv_set)[:10]
+        extra = sorted(tsv_set - srt_set)[:10]
         return False, f"ID set differs. Missing in TSV (sample): {missing}; Extra in TSV (sample): {extra}"
 
     return True, "TSV IDs match SRT IDs."
 
 
+def validate_tsv_against_srt(tsv_rows: List[List[str]], srt_entries: List[SrtEntry], align: str = "id") -> Tuple[bool, str]:
+    """Row-list form of validate_tsv_report_against_srt."""
+    return validate_tsv_report_against_srt(TSVReport.from_rows(tsv_rows), srt_entries, align=align)
+
+
 def cmd_rejoin(args) -> None:
     # Load source SRT (timestamps)
-    original_entries = parse_srt(args.original_srt)
+    original_entries = parse_srt_timestamps_only(args.original_srt)
     if not original_entries:
         raise SystemExit("No valid SRT entries found in original.")
 
@@ -535,30 +787,27 @@ def cmd_rejoin(args) -> None:
     print(summarize_report(rep))
 
     # If any row has fields > 3 or < 2, it’s malformed for our purposes.
-    malformed = any((nf < 2 or nf > 3) for nf in rep.field_histogram)
+    malformed = any((nf < 2 or nf > 3) for nf, _ in rep.histogram_items())
     if malformed:
         print("Detected TSV rows with unexpected number of columns (not 2 or 3).")
         do_fix = args.tsv_auto_fix or prompt_yes_no("Attempt to auto-fix by collapsing extra tabs into column 2?", default=True)
         if not do_fix:
             raise SystemExit("Aborting. Please fix TSV and retry (or use --tsv-auto-fix).")
 
-        fixed_rows = fix_tsv_rows_merge_middle_columns(rep.rows)
+        fixed = fix_tsv_report_merge_middle_columns(rep)
         if args.tsv_fixed_out:
-            Path(args.tsv_fixed_out).write_text(
-                "\n".join("\t".join(r) for r in fixed_rows) + "\n", encoding="utf-8"
-            )
+            with _open_text_output(args.tsv_fixed_out) as out:
+                _write_chunked(out, ("\t".join(fixed.row(i)) + "\n" for i in range(len(fixed.ids))))
             print(f"Saved fixed TSV to: {args.tsv_fixed_out}")
         # Overwrite in-memory rows to proceed
-        rep.rows = fixed_rows
-        # Update report summary after fix
-        post_hist = {3: len(fixed_rows)}
-        print(f"Post-fix: {len(fixed_rows)} lines normalized to 3 columns.")
+        rep = fixed
+        print(f"Post-fix: {len(fixed.ids)} lines normalized to 3 columns.")
     else:
         # If exactly 2 columns uniformly, we will treat col 2 as translation directly.
         pass
 
     # Validate TSV against SRT metadata (counts and/or IDs)
-    ok, msg = validate_tsv_against_srt(rep.rows, original_entries, align=args.align)
+    ok, msg = validate_tsv_report_against_srt(rep, original_entries, align=args.align)
     print("TSV vs SRT check:", msg)
     if not ok and args.strict:
         raise SystemExit("TSV validation failed (strict). Use --no-strict or fix input.")
@@ -566,7 +815,7 @@ def cmd_rejoin(args) -> None:
         print("Proceeding despite validation warnings (strict disabled).")
 
     # Convert to (id, text) pairs
-    pairs = parse_translated_pairs_from_rows(rep.rows, translation_col=args.tsv_translation_col)
+    pairs = parse_translated_pairs(rep, translation_col=args.tsv_translation_col)
 
     # Merge with timestamps
     merged = rejoin_translations(
@@ -585,7 +834,7 @@ def cmd_validate_tsv(args) -> None:
     print(summarize_report(rep))
     # Expect N columns?
     if args.expect_columns:
-        bad = [i for i, row in enumerate(rep.rows, 1) if len(row) != args.expect_columns]
+        bad = [i for i, nf in enumerate(rep.nfields, 1) if nf != args.expect_columns]
         if bad:
             print(f"Lines with != {args.expect_columns} columns: {len(bad)} (e.g., {bad[:10]})")
         else:
@@ -601,6 +850,16 @@ def cmd_validate_tsv(args) -> None:
 # CLI
 # ----------------------------
 
+def _non_negative_int(value: str) -> int:
+    try:
+        n = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected an integer (got {value!r})")
+    if n < 0:
+        raise argparse.ArgumentTypeError(f"must be >= 0 (got {n})")
+    return n
+
+
 def build_parser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(
         description="Subtitle pipeline: clean SRT, prep SRT->TSV, and rejoin TSV->SRT with validation."
@@ -613,6 +872,9 @@ def build_parser() -> argparse.ArgumentParser:
     pclean.add_argument("output_srt", help="Path to write cleaned .srt.")
     pclean.add_argument("--numbering", choices=["original", "renumber"], default="renumber",
                         help="Numbering policy for output .srt (default: renumber).")
+    pclean.add_argument("--dedupe-window", type=_non_negative_int, default=0, metavar="N",
+                        help="Also drop captions identical to one of the last N kept captions. "
+                             "Drops genuine repeated lines too (default: 0, off).")
     pclean.set_defaults(func=cmd_clean)
 
     # prep
@@ -632,7 +894,7 @@ def build_parser() -> argparse.ArgumentParser:
     # rejoin
     prej = sub.add_parser("rejoin", help="Reattach original timestamps to translated TSV.")
     prej.add_argument("original_srt", help="Path to source .srt (timestamps come from here).")
-    prej.add_argument("translated_txt", help="Path to translated TSV (2 or 3 columns).")
+    prej.add_argument("translated_txt", help="Path to translated TSV (2 or 3 columns; '-' for stdin).")
     prej.add_argument("output_srt", help="Path to write final .srt with timestamps.")
     prej.add_argument("--format", choices=["tsv", "blocks"], default="tsv",
                       help="Format of the translated file (default: tsv).")
@@ -660,7 +922,7 @@ def build_parser() -> argparse.ArgumentParser:
 
     # validate-tsv
     pv = sub.add_parser("validate-tsv", help="Validate TSV structure (columns, numeric IDs).")
-    pv.add_argument("tsv_file", help="Path to TSV to validate.")
+    pv.add_argument("tsv_file", help="Path to TSV to validate ('-' for stdin).")
     pv.add_argument("--expect-columns", type=int, default=3,
                     help="Expected number of columns per line (default: 3).")
     pv.set_defaults(func=cmd_validate_tsv)